@@ -1,45 +1,250 @@
+import csv
+import hashlib
+import os
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # backend sin ventana: solo generamos PNGs
 import matplotlib.pyplot as plt
 
 
 BASE_DIR = Path(__file__).resolve().parents[1]  # sube de /analysis/ a raíz
 DB_PATH = BASE_DIR / "data" / "simulation.sqlite"
+CACHE_DIR = BASE_DIR / ".cache_plots"
+
+# Menos trabajo con los vértices de los paths al dibujar
+plt.rcParams["path.simplify_threshold"] = 1.0
+plt.rcParams["agg.path.chunksize"] = 10000
+
+# Ningún título usa LaTeX: sin mathtext ni hinting de fuentes
+plt.rcParams["text.hinting"] = "none"
+plt.rcParams["text.parse_math"] = False
+
+# Resolución de pantalla para los PNG y compresión zlib rápida (nivel 1)
+plt.rcParams["figure.dpi"] = 96
+plt.rcParams["savefig.dpi"] = 100
+PNG_OPTIONS = {"optimize": False, "compress_level": 1}
+
+# Índices para las consultas que se repiten en varios gráficos:
+# - filtros por estado final de los pacientes
+# (el índice por día de metrics_per_country_day lo crea el logger)
+INDEXES = {
+    "idx_patient_result_state": "patient_result(final_state, patient_id)",
+}
+
+# Índices de versiones anteriores: ninguna consulta los usa (o duplican
+# idx_mpcd_day) y solo encarecen cada INSERT del logger
+OBSOLETE_INDEXES = ("idx_patient_state_day", "idx_mpcd_day_country")
+
+
+def ensure_indexes(conn):
+    # Migración idempotente: solo crea los índices que faltan
+    existing = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")
+    }
+    obsolete = [name for name in OBSOLETE_INDEXES if name in existing]
+    for name in obsolete:
+        conn.execute(f"DROP INDEX IF EXISTS {name};")
+    if obsolete:
+        conn.commit()
+
+    missing = [name for name in INDEXES if name not in existing]
+    if not missing:
+        return
+
+    for name in missing:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {INDEXES[name]};")
+
+    # Estadísticas para que el planificador de SQLite use los nuevos índices
+    conn.execute("ANALYZE;")
+    conn.commit()
+
 
+def ensure_total_pop_column(conn):
+    # Las bases nuevas ya traen total_pop como columna generada (ver logger).
+    # En bases antiguas la añadimos como columna virtual calculada por SQLite.
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(metrics_per_country_day);")}
+    if "total_pop" in columns:
+        return
+
+    conn.execute("""
+    ALTER TABLE metrics_per_country_day
+    ADD COLUMN total_pop INTEGER
+    GENERATED ALWAYS AS (healthy + infected + recovered + dead) VIRTUAL;
+    """)
+    conn.commit()
 
+
+# Una sola conexión por proceso: todas las consultas la reutilizan y
+# encuentran las páginas ya en la caché de SQLite
+@lru_cache(maxsize=1)
 def get_connection():
     if not DB_PATH.exists():
         raise FileNotFoundError(f"No se encuentra la base de datos {DB_PATH.resolve()}")
-    return sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+
+    # Ajustes de lectura: WAL, caché de 200 MB y lectura por mmap de 1 GB
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA cache_size = -200000;")
+    conn.execute("PRAGMA mmap_size = 1073741824;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+
+    ensure_total_pop_column(conn)
+    ensure_indexes(conn)
+    return conn
+
+
+# Versión de la base de datos: cambia cada vez que la simulación escribe.
+# Con WAL los cambios aún no volcados viven en el fichero -wal, así que cuenta
+# también su tamaño. Tras un checkpoint SQLite reutiliza el -wal desde el
+# principio (puede volver al mismo tamaño), pero cambia las sales de la
+# cabecera (bytes 16-24), así que también entran en la versión.
+def _db_version():
+    stat = DB_PATH.stat()
+    wal = DB_PATH.with_name(DB_PATH.name + "-wal")
+    try:
+        with open(wal, "rb") as f:
+            header = f.read(32)
+        wal_size = wal.stat().st_size
+    except FileNotFoundError:
+        header, wal_size = b"", 0
+    salt = header[16:24].hex() or "0"
+    return f"{stat.st_mtime_ns}-{stat.st_size}-{wal_size}-{salt}"
+
+
+# pd.read_sql_query con caché en disco, indexada por (consulta, parámetros, versión de la base).
+# Útil al retocar el estilo de los gráficos: si la base no cambia, no se repite el SQL.
+def read_sql_cached(conn, query, params=()):
+    version = _db_version()
+    key = hashlib.sha1(repr((query, tuple(params))).encode("utf-8")).hexdigest()
+    path = CACHE_DIR / f"{version}-{key}.pkl"
+
+    try:
+        return pd.read_pickle(path)
+    except FileNotFoundError:
+        pass
+
+    df = pd.read_sql_query(query, conn, params=params)
+
+    # Borramos las entradas de versiones anteriores de la base
+    CACHE_DIR.mkdir(exist_ok=True)
+    for old in CACHE_DIR.glob("*.pkl"):
+        if not old.name.startswith(version + "-"):
+            old.unlink(missing_ok=True)
+
+    # Escritura atómica: varios workers pueden rellenar la caché a la vez
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+    return df
+
+
+# Último día disponible en metrics_per_country_day.
+# Se calcula una sola vez por conexión y se comparte entre los gráficos.
+@lru_cache(maxsize=1)
+def get_last_day(conn):
+    return conn.execute("SELECT MAX(day) FROM metrics_per_country_day;").fetchone()[0]
+
+
+# Métricas de todos los países en el último día.
+# Una sola lectura de metrics_per_country_day que comparten los gráficos 3 y 8.
+def load_last_day_metrics(conn, last_day):
+    query = """
+    SELECT c.country_id,
+           c.name,
+           m.healthy,
+           m.infected,
+           m.recovered,
+           m.dead,
+           m.total_pop
+    FROM metrics_per_country_day AS m
+    JOIN country AS c ON c.country_id = m.country_id
+    WHERE m.day = ?;
+    """
+    return read_sql_cached(conn, query, params=(last_day,))
+
+
+# Gasto total por país (gráfico 8)
+def load_budget(conn):
+    query = "SELECT country_id, total_spend FROM budget;"
+    return read_sql_cached(conn, query)
+
+
+# Apertura de fronteras y métricas del último día por país (gráfico 9).
+# El join con metrics_per_country_day se hace en SQL, sin merge en pandas.
+def load_frontier_openness(conn, last_day):
+    # Cada ruta aparece dos veces (salida del origen, entrada al destino),
+    # así migration_route se recorre una sola vez
+    query = """
+    WITH edges AS (
+        SELECT origin_country_id AS country_id, intensity
+        FROM migration_route
+        UNION ALL
+        SELECT dest_country_id, intensity
+        FROM migration_route
+    )
+    SELECT c.country_id,
+           c.name,
+           COALESCE(SUM(e.intensity), 0) AS openness,
+           m.infected,
+           m.recovered,
+           m.total_pop
+    FROM country AS c
+    JOIN metrics_per_country_day AS m
+      ON m.country_id = c.country_id AND m.day = ?
+    LEFT JOIN edges AS e ON e.country_id = c.country_id
+    GROUP BY c.country_id;
+    """
+    return read_sql_cached(conn, query, params=(last_day,))
+
+
+# Porcentaje de población alguna vez infectada (infectados + recuperados).
+# Opera sobre arrays NumPy en un único buffer float64, sin bucles Python por país.
+def compute_spread_pct(infected, recovered, total):
+    out = np.add(infected, recovered, dtype=np.float64)
+    out *= 100.0
+    out /= total
+    return out
 
 
 # ============================================================
 # 1. Distribución de la edad de los fallecidos
 #    (What is the distribution of the age of the deceased?)
 # ============================================================
-def plot_age_distribution_of_deceased(conn):
+def plot_age_distribution_of_deceased(conn, ax):
+    # Agrupamos las edades en intervalos de 5 años directamente en SQL
     query = """
-    SELECT p.age
+    SELECT (p.age / 5) * 5 AS bin_start,
+           COUNT(*) AS deaths
     FROM patient AS p
     JOIN patient_result AS pr ON p.patient_id = pr.patient_id
-    WHERE pr.final_state = 'dead';
+    WHERE pr.final_state = 'dead'
+    GROUP BY bin_start
+    ORDER BY bin_start;
     """
-    df = pd.read_sql_query(query, conn)
+    rows = conn.execute(query).fetchall()
 
-    if df.empty:
+    if not rows:
         print("[AGE] No hay fallecidos en la simulación.")
         return
 
-    plt.figure()
-    df["age"].hist(bins=15)
-    plt.xlabel("Age")
-    plt.ylabel("Number of deaths")
-    plt.title("Distribution of age among deceased patients")
-    plt.tight_layout()
-    plt.savefig("plot_01_age_distribution_deceased.png")
-    plt.close()
+    # Pasamos las filas directamente a arrays NumPy, sin construir un DataFrame
+    n = len(rows)
+    bin_starts = np.fromiter((row[0] for row in rows), dtype=np.int32, count=n)
+    deaths = np.fromiter((row[1] for row in rows), dtype=np.int32, count=n)
+
+    ax.bar(bin_starts, deaths, width=5, align="edge", rasterized=True)
+    ax.set_xlabel("Age")
+    ax.set_ylabel("Number of deaths")
+    ax.set_title("Distribution of age among deceased patients")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_01_age_distribution_deceased.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_01_age_distribution_deceased.png")
 
 
@@ -47,7 +252,7 @@ def plot_age_distribution_of_deceased(conn):
 # 2. Gasto en vacunas y medicinas por país
 #    (How much did each country spend on vaccines and medicine?)
 # ============================================================
-def plot_spending_by_country(conn):
+def plot_spending_by_country(conn, ax):
     query = """
     SELECT c.name,
            b.total_vaccine_spend,
@@ -56,7 +261,7 @@ def plot_spending_by_country(conn):
     FROM country AS c
     JOIN budget AS b ON c.country_id = b.country_id;
     """
-    df = pd.read_sql_query(query, conn)
+    df = read_sql_cached(conn, query)
 
     if df.empty:
         print("[SPENDING] No hay datos en budget.")
@@ -65,16 +270,14 @@ def plot_spending_by_country(conn):
     df = df.set_index("name")
 
     # Grafico de barras apiladas: vacuna vs medicinas
-    plt.figure()
     df[["total_vaccine_spend", "total_medicine_spend"]].plot(
-        kind="bar", stacked=True
+        kind="bar", stacked=True, rasterized=True, ax=ax
     )
-    plt.xlabel("Country")
-    plt.ylabel("Total spend")
-    plt.title("Vaccine and medicine spending by country")
-    plt.tight_layout()
-    plt.savefig("plot_02_spending_vaccines_medicines_by_country.png")
-    plt.close()
+    ax.set_xlabel("Country")
+    ax.set_ylabel("Total spend")
+    ax.set_title("Vaccine and medicine spending by country")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_02_spending_vaccines_medicines_by_country.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_02_spending_vaccines_medicines_by_country.png")
 
 
@@ -82,38 +285,20 @@ def plot_spending_by_country(conn):
 # 3. Porcentaje de infección por país
 #    (Percentage of infection per country?)
 # ============================================================
-def plot_infection_percentage_by_country(conn):
-    # Tomamos el último día disponible en metrics_per_country_day
-    last_day_query = "SELECT MAX(day) AS max_day FROM metrics_per_country_day;"
-    last_day = pd.read_sql_query(last_day_query, conn)["max_day"].iloc[0]
-
-    query = """
-    SELECT c.name,
-           m.healthy,
-           m.infected,
-           m.recovered,
-           m.dead
-    FROM metrics_per_country_day AS m
-    JOIN country AS c ON c.country_id = m.country_id
-    WHERE m.day = ?;
-    """
-    df = pd.read_sql_query(query, conn, params=(last_day,))
-
-    if df.empty:
+def plot_infection_percentage_by_country(metrics, last_day, ax):
+    if metrics.empty:
         print("[INF PCT] No hay métricas para el último día.")
         return
 
-    total = df[["healthy", "infected", "recovered", "dead"]].sum(axis=1)
-    df["infected_pct"] = df["infected"] / total * 100
-
-    plt.figure()
-    df.plot(x="name", y="infected_pct", kind="bar", legend=False)
-    plt.xlabel("Country")
-    plt.ylabel("Infected (%)")
-    plt.title(f"Percentage of infected population per country (day {last_day})")
-    plt.tight_layout()
-    plt.savefig("plot_03_infection_percentage_by_country.png")
-    plt.close()
+    df = metrics.copy()
+    df["infected_pct"] = df["infected"] / df["total_pop"] * 100
+
+    df.plot(x="name", y="infected_pct", kind="bar", legend=False, rasterized=True, ax=ax)
+    ax.set_xlabel("Country")
+    ax.set_ylabel("Infected (%)")
+    ax.set_title(f"Percentage of infected population per country (day {last_day})")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_03_infection_percentage_by_country.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_03_infection_percentage_by_country.png")
 
 
@@ -121,22 +306,23 @@ def plot_infection_percentage_by_country(conn):
 # 4. Efectividad de las vacunas
 #    (Vaccine efficacy per vaccine brand?)
 # ============================================================
-def plot_vaccine_efficacy(conn):
-    query = "SELECT brand, efficacy FROM vaccine;"
-    df = pd.read_sql_query(query, conn)
+def plot_vaccine_efficacy(conn, ax):
+    # Resultado muy pequeño: leemos las filas directamente, sin DataFrame
+    query = "SELECT brand, efficacy FROM vaccine ORDER BY brand;"
+    rows = conn.execute(query).fetchall()
 
-    if df.empty:
+    if not rows:
         print("[VACCINE] No hay datos en vaccine.")
         return
 
-    plt.figure()
-    df.plot(x="brand", y="efficacy", kind="bar", legend=False)
-    plt.xlabel("Vaccine brand")
-    plt.ylabel("Efficacy")
-    plt.title("Vaccine efficacy by brand")
-    plt.tight_layout()
-    plt.savefig("plot_04_vaccine_efficacy_by_brand.png")
-    plt.close()
+    brands, efficacies = zip(*rows)
+
+    ax.bar(brands, efficacies, rasterized=True)
+    ax.set_xlabel("Vaccine brand")
+    ax.set_ylabel("Efficacy")
+    ax.set_title("Vaccine efficacy by brand")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_04_vaccine_efficacy_by_brand.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_04_vaccine_efficacy_by_brand.png")
 
 
@@ -144,7 +330,7 @@ def plot_vaccine_efficacy(conn):
 # 5. Tiempo total en lockdown por país
 #    (Time of lockdown per country)
 # ============================================================
-def plot_lockdown_time_by_country(conn):
+def plot_lockdown_time_by_country(conn, ax):
     query = """
     SELECT c.name,
            SUM(l.day_end - l.day_start + 1) AS total_lockdown_days
@@ -152,20 +338,19 @@ def plot_lockdown_time_by_country(conn):
     JOIN country AS c ON c.country_id = l.country_id
     GROUP BY c.name;
     """
-    df = pd.read_sql_query(query, conn)
+    df = read_sql_cached(conn, query)
 
     if df.empty:
         print("[LOCKDOWN] No hay datos de lockdown.")
         return
 
-    plt.figure()
-    df.plot(x="name", y="total_lockdown_days", kind="bar", legend=False)
-    plt.xlabel("Country")
-    plt.ylabel("Total days in lockdown")
-    plt.title("Total lockdown days per country")
-    plt.tight_layout()
-    plt.savefig("plot_05_lockdown_days_by_country.png")
-    plt.close()
+    df.plot(x="name", y="total_lockdown_days", kind="bar", legend=False,
+            rasterized=True, ax=ax)
+    ax.set_xlabel("Country")
+    ax.set_ylabel("Total days in lockdown")
+    ax.set_title("Total lockdown days per country")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_05_lockdown_days_by_country.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_05_lockdown_days_by_country.png")
 
 
@@ -173,47 +358,32 @@ def plot_lockdown_time_by_country(conn):
 # 6. Distribución de género de infectados y fallecidos
 #    (Gender distribution of infected and deceased?)
 # ============================================================
-def plot_gender_distribution_infected_and_dead(conn):
-    # Infectados (al menos una vez)
-    infected_query = """
-    SELECT p.sex, COUNT(*) AS count
+def plot_gender_distribution_infected_and_dead(conn, ax):
+    # Infectados (al menos una vez) y fallecidos en una sola consulta
+    query = """
+    SELECT p.sex,
+           SUM(CASE WHEN pr.final_state <> 'healthy' THEN 1 ELSE 0 END) AS infected,
+           SUM(CASE WHEN pr.final_state = 'dead' THEN 1 ELSE 0 END) AS dead
     FROM patient AS p
-    JOIN patient_state_per_day AS s ON p.patient_id = s.patient_id
-    WHERE s.state = 'infected'
-    GROUP BY p.sex;
+    LEFT JOIN patient_result AS pr ON p.patient_id = pr.patient_id
+    GROUP BY p.sex
+    ORDER BY p.sex;
     """
-    df_inf = pd.read_sql_query(infected_query, conn)
+    df_plot = read_sql_cached(conn, query)
 
-    # Fallecidos (estado final = dead)
-    dead_query = """
-    SELECT p.sex, COUNT(*) AS count
-    FROM patient AS p
-    JOIN patient_result AS pr ON p.patient_id = pr.patient_id
-    WHERE pr.final_state = 'dead'
-    GROUP BY p.sex;
-    """
-    df_dead = pd.read_sql_query(dead_query, conn)
-
-    if df_inf.empty and df_dead.empty:
+    if df_plot.empty or not df_plot[["infected", "dead"]].to_numpy().any():
         print("[GENDER] No hay datos de infectados/dead.")
         return
 
-    sexes = sorted(set(df_inf["sex"]).union(df_dead["sex"]))
-    df_plot = pd.DataFrame(index=sexes, columns=["infected", "dead"]).fillna(0)
-
-    if not df_inf.empty:
-        df_plot.loc[df_inf["sex"], "infected"] = df_inf["count"].values
-    if not df_dead.empty:
-        df_plot.loc[df_dead["sex"], "dead"] = df_dead["count"].values
-
-    plt.figure()
-    df_plot.plot(kind="bar")
-    plt.xlabel("Sex")
-    plt.ylabel("Number of patients")
-    plt.title("Gender distribution of infected and deceased")
-    plt.tight_layout()
-    plt.savefig("plot_06_gender_distribution_infected_dead.png")
-    plt.close()
+    # Una columna por serie, ya en enteros: lista para el gráfico de barras
+    df_plot = df_plot.set_index("sex")[["infected", "dead"]].astype("int64")
+
+    df_plot.plot(kind="bar", rasterized=True, ax=ax)
+    ax.set_xlabel("Sex")
+    ax.set_ylabel("Number of patients")
+    ax.set_title("Gender distribution of infected and deceased")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_06_gender_distribution_infected_dead.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_06_gender_distribution_infected_dead.png")
 
 
@@ -221,41 +391,30 @@ def plot_gender_distribution_infected_and_dead(conn):
 # 7. Correlación enfermedad respiratoria previa vs muertes
 #    (Correlation between previous diseases and deaths)
 # ============================================================
-def plot_respiratory_disease_vs_death(conn):
+def plot_respiratory_disease_vs_death(conn, ax):
+    # 0 = no enfermedad, 1 = con enfermedad (la etiqueta se genera en SQL)
     query = """
-    SELECT p.respiratory_disease,
-           pr.final_state
+    SELECT CASE WHEN p.respiratory_disease = 1 THEN 'Yes' ELSE 'No' END AS label,
+           SUM(pr.final_state = 'dead') * 100.0 / COUNT(*) AS death_rate_pct
     FROM patient AS p
-    JOIN patient_result AS pr ON p.patient_id = pr.patient_id;
+    JOIN patient_result AS pr ON p.patient_id = pr.patient_id
+    GROUP BY p.respiratory_disease
+    ORDER BY p.respiratory_disease;
     """
-    df = pd.read_sql_query(query, conn)
+    rows = conn.execute(query).fetchall()
 
-    if df.empty:
+    if not rows:
         print("[RESP] No hay datos suficientes.")
         return
 
-    # 0 = no enfermedad, 1 = con enfermedad
-    groups = df.groupby("respiratory_disease")
-    stats = []
-    for has_disease, sub in groups:
-        total = len(sub)
-        deaths = sum(sub["final_state"] == "dead")
-        death_rate = deaths / total * 100 if total > 0 else 0
-        stats.append({
-            "respiratory_disease": "Yes" if has_disease == 1 else "No",
-            "death_rate_pct": death_rate
-        })
-
-    df_stats = pd.DataFrame(stats)
-
-    plt.figure()
-    df_stats.plot(x="respiratory_disease", y="death_rate_pct", kind="bar", legend=False)
-    plt.xlabel("Respiratory disease")
-    plt.ylabel("Death rate (%)")
-    plt.title("Death rate vs respiratory disease")
-    plt.tight_layout()
-    plt.savefig("plot_07_death_rate_respiratory_disease.png")
-    plt.close()
+    labels, death_rates = zip(*rows)
+
+    ax.bar(labels, death_rates, rasterized=True)
+    ax.set_xlabel("Respiratory disease")
+    ax.set_ylabel("Death rate (%)")
+    ax.set_title("Death rate vs respiratory disease")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_07_death_rate_respiratory_disease.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_07_death_rate_respiratory_disease.png")
 
 
@@ -263,23 +422,9 @@ def plot_respiratory_disease_vs_death(conn):
 # 8. Relación entre presupuesto y recuperados
 #    (Relationship between the budget and recovered patients)
 # ============================================================
-def plot_budget_vs_recovered(conn):
+def plot_budget_vs_recovered(metrics, budget, last_day, ax):
     # Usamos el último día para ver cuántos recuperados hay por país
-    last_day_query = "SELECT MAX(day) AS max_day FROM metrics_per_country_day;"
-    last_day = pd.read_sql_query(last_day_query, conn)["max_day"].iloc[0]
-
-    query = """
-    SELECT c.country_id,
-           c.name,
-           b.total_spend,
-           m.recovered,
-           (m.healthy + m.infected + m.recovered + m.dead) AS total_pop
-    FROM country AS c
-    JOIN budget AS b ON c.country_id = b.country_id
-    JOIN metrics_per_country_day AS m ON c.country_id = m.country_id
-    WHERE m.day = ?;
-    """
-    df = pd.read_sql_query(query, conn, params=(last_day,))
+    df = metrics.merge(budget, on="country_id", how="inner")
 
     if df.empty:
         print("[BUDGET] No hay datos para presupuesto vs recuperados.")
@@ -287,16 +432,16 @@ def plot_budget_vs_recovered(conn):
 
     df["recovered_pct"] = df["recovered"] / df["total_pop"] * 100
 
-    plt.figure()
-    plt.scatter(df["total_spend"], df["recovered_pct"])
-    for _, row in df.iterrows():
-        plt.annotate(row["name"], (row["total_spend"], row["recovered_pct"]))
-    plt.xlabel("Total spend (vaccines + medicines)")
-    plt.ylabel("Recovered (%)")
-    plt.title(f"Budget vs recovered rate (day {last_day})")
-    plt.tight_layout()
-    plt.savefig("plot_08_budget_vs_recovered.png")
-    plt.close()
+    ax.scatter(df["total_spend"], df["recovered_pct"], rasterized=True)
+    for name, x, y in zip(df["name"].to_numpy(),
+                          df["total_spend"].to_numpy(),
+                          df["recovered_pct"].to_numpy()):
+        ax.annotate(name, (x, y))
+    ax.set_xlabel("Total spend (vaccines + medicines)")
+    ax.set_ylabel("Recovered (%)")
+    ax.set_title(f"Budget vs recovered rate (day {last_day})")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_08_budget_vs_recovered.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_08_budget_vs_recovered.png")
 
 
@@ -304,66 +449,28 @@ def plot_budget_vs_recovered(conn):
 # 9. Relación entre apertura de fronteras y propagación
 #    (Relationship between frontiers openness and virus spread)
 # ============================================================
-def plot_frontier_openness_vs_spread(conn):
-    # 1) Apertura de fronteras aproximada por suma de intensidades de migración
-    mig_query = """
-    SELECT c.country_id,
-           c.name,
-           COALESCE(outgoing.out_intensity, 0) AS out_intensity,
-           COALESCE(incoming.in_intensity, 0) AS in_intensity
-    FROM country AS c
-    LEFT JOIN (
-        SELECT origin_country_id, SUM(intensity) AS out_intensity
-        FROM migration_route
-        GROUP BY origin_country_id
-    ) AS outgoing ON c.country_id = outgoing.origin_country_id
-    LEFT JOIN (
-        SELECT dest_country_id, SUM(intensity) AS in_intensity
-        FROM migration_route
-        GROUP BY dest_country_id
-    ) AS incoming ON c.country_id = incoming.dest_country_id;
-    """
-    mig_df = pd.read_sql_query(mig_query, conn)
-
-    if mig_df.empty:
-        print("[FRONTIERS] No hay datos en migration_route.")
-        return
-
-    mig_df["openness"] = mig_df["out_intensity"] + mig_df["in_intensity"]
-
-    # 2) Propagación: porcentaje de infectados + recuperados (alguna vez infectados)
-    last_day_query = "SELECT MAX(day) AS max_day FROM metrics_per_country_day;"
-    last_day = pd.read_sql_query(last_day_query, conn)["max_day"].iloc[0]
-
-    spread_query = """
-    SELECT c.country_id,
-           c.name,
-           m.infected,
-           m.recovered,
-           (m.healthy + m.infected + m.recovered + m.dead) AS total_pop
-    FROM country AS c
-    JOIN metrics_per_country_day AS m ON c.country_id = m.country_id
-    WHERE m.day = ?;
-    """
-    spread_df = pd.read_sql_query(spread_query, conn, params=(last_day,))
-
-    df = pd.merge(mig_df, spread_df, on=["country_id", "name"], how="inner")
-    if df.empty:
+def plot_frontier_openness_vs_spread(frontiers, last_day, ax):
+    # 1) Apertura de fronteras (suma de intensidades de migración) y
+    # 2) propagación: porcentaje de infectados + recuperados (alguna vez infectados)
+    if frontiers.empty:
         print("[FRONTIERS] No hay datos suficientes para la relación apertura-propagación.")
         return
 
-    df["spread_pct"] = (df["infected"] + df["recovered"]) / df["total_pop"] * 100
-
-    plt.figure()
-    plt.scatter(df["openness"], df["spread_pct"])
-    for _, row in df.iterrows():
-        plt.annotate(row["name"], (row["openness"], row["spread_pct"]))
-    plt.xlabel("Frontier openness (migration intensity)")
-    plt.ylabel("Spread (% ever infected)")
-    plt.title(f"Frontier openness vs virus spread (day {last_day})")
-    plt.tight_layout()
-    plt.savefig("plot_09_frontier_openness_vs_spread.png")
-    plt.close()
+    df = frontiers.copy()
+    df["spread_pct"] = compute_spread_pct(
+        df["infected"].to_numpy(), df["recovered"].to_numpy(), df["total_pop"].to_numpy()
+    )
+
+    ax.scatter(df["openness"], df["spread_pct"], rasterized=True)
+    for name, x, y in zip(df["name"].to_numpy(),
+                          df["openness"].to_numpy(),
+                          df["spread_pct"].to_numpy()):
+        ax.annotate(name, (x, y))
+    ax.set_xlabel("Frontier openness (migration intensity)")
+    ax.set_ylabel("Spread (% ever infected)")
+    ax.set_title(f"Frontier openness vs virus spread (day {last_day})")
+    ax.figure.tight_layout()
+    ax.figure.savefig("plot_09_frontier_openness_vs_spread.png", pil_kwargs=PNG_OPTIONS)
     print("[OK] plot_09_frontier_openness_vs_spread.png")
 
 
@@ -381,15 +488,56 @@ def table_countries_and_policies(conn):
     SELECT name, vaccine_brand, treatment_type, mask_prob
     FROM country;
     """
-    df = pd.read_sql_query(query, conn)
-    if df.empty:
+    cur = conn.execute(query)
+    rows = cur.fetchall()
+    if not rows:
         print("[POLICIES] No hay datos en country.")
         return
 
-    # Exportamos a CSV y también lo mostramos por pantalla
-    df.to_csv("table_countries_policies.csv", index=False)
+    header = [col[0] for col in cur.description]
+
+    # Exportamos a CSV directamente desde el cursor (sin pandas) y lo mostramos por pantalla
+    with open("table_countries_policies.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
     print("[OK] table_countries_policies.csv generado.")
-    print(df)
+
+    print(f"{header[0]:8} | {header[1]:13} | {header[2]:14} | {header[3]}")
+    for name, vaccine_brand, treatment_type, mask_prob in rows:
+        print(f"{name:8} | {vaccine_brand:13} | {treatment_type:14} | {mask_prob:.2f}")
+
+
+# ============================================================
+# EJECUCIÓN EN PARALELO
+# ============================================================
+# Estado de cada proceso worker: su propia conexión (las conexiones de
+# SQLite no se pueden compartir entre procesos) y su propia figura reutilizable.
+_worker = {}
+
+
+def _init_worker():
+    # Una sola figura por worker: se limpia entre un gráfico y otro
+    fig, ax = plt.subplots()
+
+    # Dibujo de calentamiento: llena las cachés de fuentes y glifos
+    ax.set_title("Warm-up")
+    ax.set_xlabel("Warm-up")
+    fig.canvas.draw()
+
+    # Con fork el worker hereda la conexión cacheada del proceso principal,
+    # que no se puede usar desde otro proceso: se abre una propia
+    get_connection.cache_clear()
+    _worker["conn"] = get_connection()
+    _worker["ax"] = ax
+
+
+def _run_plot(plot, uses_db, args):
+    ax = _worker["ax"]
+    ax.clear()
+    if uses_db:
+        args = (_worker["conn"],) + args
+    plot(*args, ax)
 
 
 # ============================================================
@@ -399,18 +547,38 @@ def main():
     conn = get_connection()
 
     try:
-        plot_age_distribution_of_deceased(conn)
-        plot_spending_by_country(conn)
-        plot_infection_percentage_by_country(conn)
-        plot_vaccine_efficacy(conn)
-        plot_lockdown_time_by_country(conn)
-        plot_gender_distribution_infected_and_dead(conn)
-        plot_respiratory_disease_vs_death(conn)
-        plot_budget_vs_recovered(conn)
-        plot_frontier_openness_vs_spread(conn)
+        # Datos compartidos por varios gráficos: se leen una sola vez
+        last_day = get_last_day(conn)
+        last_day_metrics = load_last_day_metrics(conn, last_day)
+        budget = load_budget(conn)
+        frontiers = load_frontier_openness(conn, last_day)
+
+        # (función, ¿lee de la base?, argumentos)
+        plots = [
+            (plot_age_distribution_of_deceased, True, ()),
+            (plot_spending_by_country, True, ()),
+            (plot_infection_percentage_by_country, False, (last_day_metrics, last_day)),
+            (plot_vaccine_efficacy, True, ()),
+            (plot_lockdown_time_by_country, True, ()),
+            (plot_gender_distribution_infected_and_dead, True, ()),
+            (plot_respiratory_disease_vs_death, True, ()),
+            (plot_budget_vs_recovered, False, (last_day_metrics, budget, last_day)),
+            (plot_frontier_openness_vs_spread, False, (frontiers, last_day)),
+        ]
+
+        # Los gráficos son independientes: cada uno produce su PNG en un proceso distinto
+        max_workers = min(os.cpu_count() or 1, len(plots))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as ex:
+            futures = [ex.submit(_run_plot, plot, uses_db, args) for plot, uses_db, args in plots]
+            for future in futures:
+                future.result()
+
         table_countries_and_policies(conn)
     finally:
+        # get_last_day guarda una referencia a la conexión: se vacía con ella
         conn.close()
+        get_connection.cache_clear()
+        get_last_day.cache_clear()
 
 
 if __name__ == "__main__":
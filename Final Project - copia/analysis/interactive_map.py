@@ -1,4 +1,6 @@
+import math
 import sqlite3
+from functools import lru_cache
 from pathlib import Path
 
 import pandas as pd
@@ -18,34 +20,58 @@ COUNTRY_ISO3 = {
     "UK":      "GBR",
 }
 
+# Máximo de frames de la animación: con muchos más el slider de Plotly va lento
+MAX_FRAMES = 60
 
+
+# Una sola conexión reutilizada, con la caché de páginas ya caliente
+@lru_cache(maxsize=1)
 def get_connection():
     if not DB_PATH.exists():
         raise FileNotFoundError(f"No se encuentra {DB_PATH.resolve()}")
-    return sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA cache_size = -200000;")
+    conn.execute("PRAGMA mmap_size = 1073741824;")
+    return conn
 
 
 def build_time_series_df(conn):
-    query = """
-    SELECT
-        m.day,
-        c.name,
-        m.healthy,
-        m.infected,
-        m.recovered,
-        m.dead
-    FROM metrics_per_country_day AS m
-    JOIN country AS c ON c.country_id = m.country_id
-    ORDER BY m.day, c.name;
-    """
+    # La simulación deja la serie temporal ya unida en ts_cache;
+    # con bases de datos anteriores se hace el join aquí
+    has_cache = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ts_cache';"
+    ).fetchone()
+    if has_cache:
+        query = """
+        SELECT day, name, healthy, infected, recovered, dead, total
+        FROM ts_cache
+        ORDER BY day, name;
+        """
+    else:
+        query = """
+        SELECT
+            m.day,
+            c.name,
+            m.healthy,
+            m.infected,
+            m.recovered,
+            m.dead,
+            m.healthy + m.infected + m.recovered + m.dead AS total
+        FROM metrics_per_country_day AS m
+        JOIN country AS c ON c.country_id = m.country_id
+        ORDER BY m.day, c.name;
+        """
     df = pd.read_sql_query(query, conn)
 
     if df.empty:
         raise ValueError("No hay datos en metrics_per_country_day. ¿Has corrido la simulación?")
 
-    df["total"] = df["healthy"] + df["infected"] + df["recovered"] + df["dead"]
+    # Tipos más pequeños: menos memoria y menos bytes en los frames de Plotly
+    for col in ("day", "healthy", "infected", "recovered", "dead", "total"):
+        df[col] = pd.to_numeric(df[col], downcast="unsigned")
+
     df["infected_pct"] = df["infected"] / df["total"] * 100
-    df["infected_pct"] = df["infected_pct"].round(2)
+    df["infected_pct"] = df["infected_pct"].round(2).astype("float32")
 
     df["iso_code"] = df["name"].map(COUNTRY_ISO3)
     df = df.dropna(subset=["iso_code"])
@@ -53,16 +79,36 @@ def build_time_series_df(conn):
     return df
 
 
-def make_interactive_map(df):
+def make_interactive_map(df, frame_stride=None):
+    # Solo se anima uno de cada frame_stride días (por defecto, el menor
+    # que deja la animación en MAX_FRAMES frames como mucho)
+    days = df["day"].unique()
+    if frame_stride is None:
+        frame_stride = max(1, math.ceil(len(days) / MAX_FRAMES))
+    elif frame_stride <= 0:
+        raise ValueError(f"frame_stride debe ser positivo, no {frame_stride}")
+    if frame_stride > 1:
+        # El último día siempre se muestra: es el estado final de la simulación
+        kept = days[::frame_stride]
+        if kept[-1] != days[-1]:
+            kept = list(kept) + [days[-1]]
+        df = df[df["day"].isin(kept)].copy()
+
     max_pct = df["infected_pct"].max()
 
-    df["hover_text"] = (
-        "Country: " + df["name"] +
-        "<br>Day: " + df["day"].astype(str) +
-        "<br>Infected: " + df["infected"].astype(str) +
-        "<br>Total pop: " + df["total"].astype(str) +
-        "<br><b>Infected %: " + df["infected_pct"].astype(str) + "%</b>"
-    )
+    # Una sola pasada sobre los arrays, sin Series intermedias por cada "+"
+    # (!s: str() de un float32 da la forma corta, 14.8 y no 14.800000190734863)
+    df["hover_text"] = [
+        f"Country: {name}<br>Day: {day}<br>Infected: {infected}"
+        f"<br>Total pop: {total}<br><b>Infected %: {pct!s}%</b>"
+        for name, day, infected, total, pct in zip(
+            df["name"].to_numpy(),
+            df["day"].to_numpy(),
+            df["infected"].to_numpy(),
+            df["total"].to_numpy(),
+            df["infected_pct"].to_numpy(),
+        )
+    ]
 
     fig = px.choropleth(
         df,
@@ -71,7 +117,6 @@ def make_interactive_map(df):
         hover_name="name",
         hover_data={"iso_code": False, "infected_pct": True, "hover_text": False},
         animation_frame="day",
-        animation_group="name",
         color_continuous_scale="OrRd",   # escala rojiza más agradable
         range_color=(0, max_pct),
         scope="europe",
@@ -130,7 +175,16 @@ def make_interactive_map(df):
         }]
     )
 
-    fig.write_html("interactive_map.html")
+    # plotly.js se carga del CDN en vez de incrustar ~3.5 MB en el HTML;
+    # la figura ya la ha validado px.choropleth
+    fig.write_html(
+        "interactive_map.html",
+        include_plotlyjs="cdn",
+        validate=False,
+        auto_play=False,
+        default_width="100%",
+        default_height="700px",
+    )
     print("✅ Mapa interactivo guardado en 'interactive_map.html'")
 
 
@@ -141,6 +195,7 @@ def main():
         make_interactive_map(df)
     finally:
         conn.close()
+        get_connection.cache_clear()
 
 if __name__ == "__main__":
     main()
@@ -1,60 +1,83 @@
 #LOGIC FOR DISEASES AND HOSPITAL
-import random
 from .config import (
-    MASK_EFFECTIVENESS,
     INFECTIOUS_PERIOD_RANGE,
     DAILY_DEATH_MULTIPLIER,
-    VARIANT_DAY,
-    VARIANT_VACCINE_EFFECTIVENESS_DROP,
     TREATMENT_COST,
     LOCKDOWN_CONTACT_FACTOR,
     CONTACTS_RANGE,
     SUPERSPREADER_MULTIPLIER,
     treatment_effectiveness,
-    vaccine_effectiveness,
 )
 
+#Derived constants, computed once instead of inside the contact loop
+CONTACTS_MIN, CONTACTS_MAX = CONTACTS_RANGE
+INFECTIOUS_MIN, INFECTIOUS_MAX = INFECTIOUS_PERIOD_RANGE
+
 def allocate_treatment_if_budget(country, patient):
     #Assign treatment or hospitalization to a patient if the country has resources
+    #The caller must hold country.lock, since budget and hospital beds are shared
 
-    with country.lock:
-        patient.hospitalized = False
+    patient.hospitalized = False
 
-        #No treatment available
-        if not country.treatments:
-            patient.has_treatment = False
-            patient.treatment_type = None
-            return
-
-        #Identifies high risk patients
-        high_risk = (patient.age >= 65) or patient.respiratory_disease
-
-        #Identify which countries can afford treatment today: Two conditions
-        can_treat_today = (
-            country.budget_remaining >= TREATMENT_COST
-            and country.treatments_given_today < country.max_daily_treatments
-        )
-
-        if can_treat_today:
-            #Country avoids overspending unless patient is high-risk
-            safety_threshold = 0.3 * country.budget_total
-            if high_risk or country.budget_remaining > safety_threshold:
-                patient.has_treatment = True
-                patient.treatment_type = random.choice(country.treatments)
-                country.budget_remaining -= TREATMENT_COST
-                country.budget_spent_treatments += TREATMENT_COST
-                country.treatments_given_today += 1
-            else:
-                patient.has_treatment = False
-                patient.treatment_type = None
+    #No treatment available
+    if not country.treatments:
+        patient.has_treatment = False
+        patient.treatment_type = None
+        return
+
+    #Identifies high risk patients
+    high_risk = patient.high_risk
+
+    #Identify which countries can afford treatment today: Two conditions
+    can_treat_today = (
+        country.budget_remaining >= TREATMENT_COST
+        and country.treatments_given_today < country.max_daily_treatments
+    )
+
+    if can_treat_today:
+        #Country avoids overspending unless patient is high-risk
+        safety_threshold = 0.3 * country.budget_total
+        if high_risk or country.budget_remaining > safety_threshold:
+            patient.has_treatment = True
+            patient.treatment_type = country.rng.choice(country.treatments)
+            country.budget_remaining -= TREATMENT_COST
+            country.budget_spent_treatments += TREATMENT_COST
+            country.treatments_given_today += 1
         else:
             patient.has_treatment = False
             patient.treatment_type = None
+    else:
+        patient.has_treatment = False
+        patient.treatment_type = None
+
+    #High risk patients may be hospitalized if capacity allows
+    if high_risk and country.current_hospitalized < country.hospital_capacity:
+        patient.hospitalized = True
+        country.current_hospitalized += 1
+
+
+#Frees the hospital bed of a patient who leaves the infected state
+#The caller must hold country.lock
+def _release_bed_locked(country, patient):
+    if patient.hospitalized and country.current_hospitalized > 0:
+        country.current_hospitalized -= 1
+        patient.hospitalized = False
+
+
+#Marks a patient as recovered, freeing its bed in the same critical section
+def record_recovery(country, patient):
+    with country.lock:
+        _release_bed_locked(country, patient)
+        patient.state = "recovered"
+
 
-        #High risk patients may be hospitalized if capacity allows
-        if high_risk and country.current_hospitalized < country.hospital_capacity:
-            patient.hospitalized = True
-            country.current_hospitalized += 1
+#Marks a patient as dead and takes it out of the country's alive list,
+#freeing its bed in the same critical section
+def record_death(country, patient):
+    with country.lock:
+        _release_bed_locked(country, patient)
+        patient.state = "dead"
+        country.remove_from_alive(patient)
 
 
 def infection_step(patient, country, day):
@@ -62,85 +85,81 @@ def infection_step(patient, country, day):
 
     p = patient
 
+    #Each country draws from its own generator
+    rng = country.rng
+
     #Only infected patients continue through the infection process
-    if p.state in ("healthy", "recovered", "dead"):
+    #(a single comparison, since most patients of a batch are not infected)
+    if p.state != "infected":
         return
 
-    high_risk = (p.age >= 65) or p.respiratory_disease
+    high_risk = p.high_risk
 
     #Assign an infectious period the first time
     if p.infectious_period is None:
-        p.infectious_period = random.randint(*INFECTIOUS_PERIOD_RANGE)
-
-    #List of healthy people who could be infected
-    with country.lock:
-        healthy_people = [x for x in country.patients if x.state == "healthy"]
+        p.infectious_period = rng.randint(INFECTIOUS_MIN, INFECTIOUS_MAX)
 
     #Infection spread phase (before recovery/death)
     if p.days_infected < p.infectious_period:
-        cmin, cmax = CONTACTS_RANGE
-        contacts_count = random.randint(cmin, cmax)
+        contacts_count = rng.randint(CONTACTS_MIN, CONTACTS_MAX)
 
         #Lockdown reduces contacts
-        in_lockdown = any(s <= day <= e for (s, e) in country.lockdown_days)
-        if in_lockdown:
+        if country.in_lockdown:
             contacts_count = max(1, int(contacts_count * LOCKDOWN_CONTACT_FACTOR))
 
         #Superspreaders multiply the number of contacts
         if p.is_superspreader:
             contacts_count *= SUPERSPREADER_MULTIPLIER
 
-        #Choose people contacted today
+        #Choose people contacted today among those still healthy
+        #For k much smaller than the pool, random.sample draws k distinct indices
+        #(set-based selection, no copy of the pool); when the contacts cover
+        #everyone left, the pool is taken as is
         with country.lock:
-            contacts = random.sample(
-                healthy_people,
-                #This ensures we never try to select more healthy people than actually exist
-                k=min(len(healthy_people), contacts_count)
-            ) if healthy_people else []
+            healthy_people = country.healthy_pool
+            if contacts_count >= len(healthy_people):
+                contacts = list(healthy_people)
+            else:
+                contacts = rng.sample(healthy_people, k=contacts_count)
+
+        #The infected person's side of the probability is the same for every contact
+        source_prob = country.base_transmission * p.mask_factor
+        vaccine_factor = country.vaccine_factor
 
         #Attempt to infect each contact, calculates probability
+        newly_infected = []
         for target in contacts:
-            prob = country.base_transmission
-
-            #Mask effect
-            if target.mask:
-                prob *= (1 - MASK_EFFECTIVENESS)
-            if p.mask:
-                prob *= (1 - MASK_EFFECTIVENESS)
-
-            #Vaccine effect
-            if target.vaccinated:
-                vtype = target.vaccine_type or country.vaccine
-                eff = vaccine_effectiveness[vtype]
-
-                #The new variant reduces vaccine effectiveness
-                if day >= VARIANT_DAY:
-                    eff = max(0.0, eff - VARIANT_VACCINE_EFFECTIVENESS_DROP)
-                prob *= (1 - eff)
+            #Mask and vaccine effects as plain factors (1.0 when they do not apply);
+            #the vaccine one is already reduced by the new variant if it is active
+            prob = source_prob * target.mask_factor * vaccine_factor[target.vaccine_type]
 
             #Infection occurs
-            if random.random() < prob:
-                with country.lock:
-                    if target.state == "healthy":
+            if rng.random() < prob:
+                newly_infected.append(target)
+
+        #Infections are applied in a single critical section
+        if newly_infected:
+            with country.lock:
+                for target in newly_infected:
+                    #Another worker may have infected the same person meanwhile,
+                    #or the person may have travelled out of this country's pool
+                    if target.state == "healthy" and country.remove_from_healthy_pool(target):
                         target.state = "infected"
                         target.days_infected = 0
-                        target.infectious_period = random.randint(*INFECTIOUS_PERIOD_RANGE)
+                        target.infectious_period = rng.randint(INFECTIOUS_MIN, INFECTIOUS_MAX)
                         allocate_treatment_if_budget(country, target)
 
     #Daily probability of death while infected
-    death_prob = p.death_probability() * DAILY_DEATH_MULTIPLIER
+    death_prob = p.base_death_prob * DAILY_DEATH_MULTIPLIER
     if p.hospitalized:
         death_prob *= 0.5
     elif high_risk:
         death_prob *= 1.5
 
     #Death occurs
-    if random.random() < death_prob:
-        with country.lock:
-            if p.hospitalized and country.current_hospitalized > 0:
-                country.current_hospitalized -= 1
-                p.hospitalized = False
-            p.state = "dead"
+    #The bed, the state and the alive list are updated in one critical section
+    if rng.random() < death_prob:
+        record_death(country, p)
         return
 
     p.days_infected += 1
@@ -148,10 +167,10 @@ def infection_step(patient, country, day):
     #Final day
     if p.days_infected >= p.infectious_period:
         treat_prob = treatment_effectiveness.get(p.treatment_type, 0.0) if p.has_treatment else 0.0
-        r = random.random()
+        r = rng.random()
 
         #Final death chance
-        base_final_death_prob = p.death_probability() * 0.7
+        base_final_death_prob = p.base_death_prob * 0.7
         if p.hospitalized:
             base_final_death_prob *= 0.5
         elif high_risk:
@@ -162,14 +181,13 @@ def infection_step(patient, country, day):
             result = "recovered"
 
         #Otherwise determine death or recovery
-        elif random.random() < base_final_death_prob:
+        elif rng.random() < base_final_death_prob:
             result = "dead"
         else:
             result = "recovered"
 
         #Update final state
-        with country.lock:
-            if p.hospitalized and country.current_hospitalized > 0:
-                country.current_hospitalized -= 1
-                p.hospitalized = False
-            p.state = result
+        if result == "dead":
+            record_death(country, p)
+        else:
+            record_recovery(country, p)
@@ -2,10 +2,11 @@
 
 import sqlite3
 import threading
+from collections import Counter
 from pathlib import Path
 
 class SQLiteLogger:
-    def __init__(self, db_path="simulation.sqlite"):
+    def __init__(self, db_path="simulation.sqlite", exclusive=True):
         #Path of the SQlite database where all simulation data will be saved
         self.db_path = Path(db_path)
         #Connect to the database
@@ -15,14 +16,24 @@ class SQLiteLogger:
         #Basic sqlite performance settings.
         self.conn.execute("PRAGMA foreign_keys = ON;")
         self.conn.execute("PRAGMA journal_mode = WAL;")
+        #The logger is the only writer while the simulation runs, so it keeps
+        #the file lock instead of taking and releasing it on every transaction.
+        #exclusive=False keeps the default locking so other connections can
+        #read the database while the simulation is still writing
+        if exclusive:
+            self.conn.execute("PRAGMA locking_mode = EXCLUSIVE;")
         self.conn.execute("PRAGMA synchronous = NORMAL;")
+        self.conn.execute("PRAGMA temp_store = MEMORY;")
+        self.conn.execute("PRAGMA cache_size = -200000;")
+        self.conn.execute("PRAGMA mmap_size = 268435456;")
 
         self._create_tables()
 
         #Buffers para batch inserts
         #Batch inserts are much faster than logging each event separately
         self.daily_states = []
-        self._migration_counts = {}
+        self.metrics_buffer = []
+        self._migration_counts = Counter()
 
         #Tracks special events for patients
         self._first_infected = {}
@@ -102,12 +113,13 @@ class SQLiteLogger:
         """)
 
         #Table daily status
+        #Append-only during the run: its (patient_id, day) key is created as a
+        #unique index once all days are loaded (see finalize_state_table)
         cur.execute("""
         CREATE TABLE IF NOT EXISTS patient_state_per_day (
             patient_id INTEGER NOT NULL REFERENCES patient(patient_id),
             day        INTEGER NOT NULL,
-            state      TEXT NOT NULL CHECK (state IN ('healthy','infected','recovered','dead')),
-            PRIMARY KEY (patient_id, day)
+            state      TEXT NOT NULL CHECK (state IN ('healthy','infected','recovered','dead'))
         );
         """)
 
@@ -142,9 +154,11 @@ class SQLiteLogger:
             infected   INTEGER NOT NULL,
             recovered  INTEGER NOT NULL,
             dead       INTEGER NOT NULL,
+            total_pop  INTEGER GENERATED ALWAYS AS (healthy + infected + recovered + dead) STORED,
             PRIMARY KEY (country_id, day)
         );
         """)
+        self._ensure_total_pop_column(cur)
 
         #Travel
         cur.execute("""
@@ -156,10 +170,58 @@ class SQLiteLogger:
         );
         """)
 
+        #Index for the per-day reads done by the analysis scripts
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mpcd_day
+        ON metrics_per_country_day(day, country_id);
+        """)
 
+        #Indexes left by older analysis scripts: unused or duplicated, they only slow the inserts
+        cur.execute("DROP INDEX IF EXISTS idx_patient_state_day;")
+        cur.execute("DROP INDEX IF EXISTS idx_mpcd_day_country;")
+
+        #Time series of every country, used by the interactive map
+        cur.execute("""
+        CREATE VIEW IF NOT EXISTS v_time_series AS
+        SELECT m.day, c.name, m.healthy, m.infected, m.recovered, m.dead,
+               m.total_pop AS total
+        FROM metrics_per_country_day AS m
+        JOIN country AS c USING (country_id);
+        """)
 
         self.conn.commit()
 
+    #CREATE TABLE IF NOT EXISTS leaves the table of an older database as it was,
+    #so total_pop is added there as a VIRTUAL column (ALTER TABLE cannot add STORED)
+    def _ensure_total_pop_column(self, cur):
+        columns = {row[1] for row in cur.execute("PRAGMA table_xinfo(metrics_per_country_day);")}
+        if "total_pop" in columns:
+            return
+        cur.execute("""
+        ALTER TABLE metrics_per_country_day
+        ADD COLUMN total_pop INTEGER
+        GENERATED ALWAYS AS (healthy + infected + recovered + dead) VIRTUAL;
+        """)
+
+    #Bulk transactions
+    #The insert/log methods below do not commit on their own: the caller opens
+    #one transaction per phase (world setup, each simulated day) and commits it
+    #at the end, so SQLite syncs the WAL once per phase instead of once per row.
+    def begin_bulk(self):
+        with self._lock:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN IMMEDIATE;")
+
+    def commit_bulk(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        #Closing the connection also gives back the exclusive lock
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
     #Catalog
     #Insert or update vaccines in the database.
     def upsert_vaccine(self, brand, efficacy, unit_cost):
@@ -171,7 +233,6 @@ class SQLiteLogger:
                 efficacy=excluded.efficacy,
                 unit_cost=excluded.unit_cost;
             """, (brand, efficacy, unit_cost))
-            self.conn.commit()
 
     # Insert or update treatments.
     def upsert_treatment(self, brand, efficacy, unit_cost):
@@ -183,7 +244,6 @@ class SQLiteLogger:
                 efficacy=excluded.efficacy,
                 unit_cost=excluded.unit_cost;
             """, (brand, efficacy, unit_cost))
-            self.conn.commit()
 
     #Country + patients + budget
     def insert_country(self, country):
@@ -206,7 +266,6 @@ class SQLiteLogger:
                 country.treatment,
                 country.mask_prob,
             ))
-            self.conn.commit()
 
             cur.execute("SELECT country_id FROM country WHERE name=?;", (country.name,))
             return cur.fetchone()[0]
@@ -214,13 +273,10 @@ class SQLiteLogger:
     def insert_lockdowns(self, country_id, lockdown_days):
     #Store lockdown periods for a given country.
         with self._lock:
-            cur = self.conn.cursor()
-            for s, e in lockdown_days:
-                cur.execute("""
-                INSERT INTO lockdown (country_id, day_start, day_end)
-                VALUES (?, ?, ?);
-                """, (country_id, s, e))
-            self.conn.commit()
+            self.conn.executemany("""
+            INSERT INTO lockdown (country_id, day_start, day_end)
+            VALUES (?, ?, ?);
+            """, [(country_id, s, e) for s, e in lockdown_days])
 
     def insert_budget(self, country_id, vaccine_units, medicine_units,
                       vaccine_unit_cost, medicine_unit_cost):
@@ -240,7 +296,6 @@ class SQLiteLogger:
                 country_id, vaccine_units, medicine_units,
                 vaccine_unit_cost, medicine_unit_cost
             ))
-            self.conn.commit()
 
     def insert_patient(self, country_id, p):
         #Insert a single patient with all their fixed attributes.
@@ -259,9 +314,7 @@ class SQLiteLogger:
                 1 if p.mask else 0,
                 1 if p.is_superspreader else 0,
             ))
-            pid = cur.lastrowid
-            self.conn.commit()
-            return pid
+            return cur.lastrowid
 
     #Daily logging
     def log_patient_state(self, patient, day):
@@ -281,23 +334,65 @@ class SQLiteLogger:
         elif state == "dead":
             self._death_day[pid] = day
 
+    #Logs the state of a whole population for one day with a single executemany,
+    #instead of one log_patient_state call per patient
+    def log_patient_states(self, patients, day):
+        rows = [(p.db_id, day, p.state) for p in patients]
+        if not rows:
+            return
+
+        #Record special events
+        first_infected = self._first_infected
+        recovered_day = self._recovered_day
+        death_day = self._death_day
+        for pid, _, state in rows:
+            if state == "infected":
+                if pid not in first_infected:
+                    first_infected[pid] = day
+            elif state == "recovered":
+                recovered_day[pid] = day
+            elif state == "dead":
+                death_day[pid] = day
+
+        with self._lock:
+            self.conn.executemany("""
+                INSERT INTO patient_state_per_day (patient_id, day, state)
+                VALUES (?, ?, ?)
+            """, rows)
+
     def flush_daily_states(self):
         #Write accumulated patient states to the DB
         if not self.daily_states:
             return
         with self._lock:
-            cur = self.conn.cursor()
-            cur.executemany("""
+            self.conn.executemany("""
                 INSERT INTO patient_state_per_day (patient_id, day, state)
                 VALUES (?, ?, ?)
             """, self.daily_states)
-            self.conn.commit()
         self.daily_states = []
 
+    def finalize_state_table(self):
+        #Writes what is left in the buffer and builds the key index in one pass,
+        #instead of maintaining the B-tree on every daily insert
+        self.flush_daily_states()
+        with self._lock:
+            self.conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_psd_patient_day
+            ON patient_state_per_day(patient_id, day);
+            """)
+            self.conn.commit()
+
     #Country daily metrics, will be later used for plots
     def log_metrics(self, country_id, day, healthy, infected, recovered, dead):
+        #Buffered like the patient states, written once per day by flush_metrics
+        self.metrics_buffer.append((country_id, day, healthy, infected, recovered, dead))
+
+    def flush_metrics(self):
+        #Write the accumulated country metrics to the DB
+        if not self.metrics_buffer:
+            return
         with self._lock:
-            self.conn.execute("""
+            self.conn.executemany("""
             INSERT INTO metrics_per_country_day (country_id, day, healthy, infected, recovered, dead)
             VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(country_id, day) DO UPDATE SET
@@ -305,62 +400,76 @@ class SQLiteLogger:
                 infected=excluded.infected,
                 recovered=excluded.recovered,
                 dead=excluded.dead;
-            """, (country_id, day, healthy, infected, recovered, dead))
-            self.conn.commit()
+            """, self.metrics_buffer)
+        self.metrics_buffer = []
 
     #Migration
-    def log_travel(self, origin_country_id, dest_country_id):
-        #Count every trip in memory
-        key = (origin_country_id, dest_country_id)
-        self._migration_counts[key] = self._migration_counts.get(key, 0) + 1
+    def log_travel(self, origin_country_id, dest_country_id, count=1):
+        #Count the trips of a route in memory
+        self._migration_counts[(origin_country_id, dest_country_id)] += count
 
     def finalize_migration_routes(self, populations_by_id):
         #Convert total travel counts into "intensity" (count / population)
         #Finally store them to the DB
+        rows = [
+            (origin_id, dest_id, count / populations_by_id.get(origin_id, 1))
+            for (origin_id, dest_id), count in self._migration_counts.items()
+        ]
         with self._lock:
-            cur = self.conn.cursor()
-            for (origin_id, dest_id), count in self._migration_counts.items():
-                pop = populations_by_id.get(origin_id, 1)
-                intensity = count / pop
-                cur.execute("""
-                INSERT INTO migration_route (origin_country_id, dest_country_id, intensity)
-                VALUES (?, ?, ?)
-                ON CONFLICT(origin_country_id, dest_country_id) DO UPDATE SET
-                    intensity=excluded.intensity;
-                """, (origin_id, dest_id, intensity))
+            self.conn.executemany("""
+            INSERT INTO migration_route (origin_country_id, dest_country_id, intensity)
+            VALUES (?, ?, ?)
+            ON CONFLICT(origin_country_id, dest_country_id) DO UPDATE SET
+                intensity=excluded.intensity;
+            """, rows)
+            self.conn.commit()
+
+    #Materializes v_time_series once the simulation has finished,
+    #so the analysis step reads a plain table instead of redoing the join
+    def materialize_time_series(self):
+        with self._lock:
+            self.conn.execute("DROP TABLE IF EXISTS ts_cache;")
+            self.conn.execute("""
+            CREATE TABLE ts_cache AS
+            SELECT * FROM v_time_series
+            ORDER BY day, name;
+            """)
             self.conn.commit()
 
     #Stores the vaccines usage
     def insert_vaccine_usage(self, country_id, vaccine_units_dict):
-        with self.conn:
-            for brand, units in vaccine_units_dict.items():
-                if units > 0:
-                    self.conn.execute(
-                        "INSERT INTO vaccine_usage (country_id, brand, units) VALUES (?, ?, ?)",
-                        (country_id, brand, units),
-                    )
+        rows = [
+            (country_id, brand, units)
+            for brand, units in vaccine_units_dict.items()
+            if units > 0
+        ]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO vaccine_usage (country_id, brand, units) VALUES (?, ?, ?)",
+                rows,
+            )
 
     #Final results per patient
     def finalize_patient_results(self, patients):
+        rows = [
+            (
+                p.db_id,
+                self._first_infected.get(p.db_id),
+                self._recovered_day.get(p.db_id),
+                self._death_day.get(p.db_id),
+                p.state,
+            )
+            for p in patients
+        ]
         with self._lock:
-            cur = self.conn.cursor()
-            for p in patients:
-                pid = p.db_id
-                final_state = p.state
-                cur.execute("""
-                INSERT INTO patient_result (patient_id, first_infected_day,
-                                            recovered_day, death_day, final_state)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(patient_id) DO UPDATE SET
-                    first_infected_day=excluded.first_infected_day,
-                    recovered_day=excluded.recovered_day,
-                    death_day=excluded.death_day,
-                    final_state=excluded.final_state;
-                """, (
-                    pid,
-                    self._first_infected.get(pid),
-                    self._recovered_day.get(pid),
-                    self._death_day.get(pid),
-                    final_state,
-                ))
+            self.conn.executemany("""
+            INSERT INTO patient_result (patient_id, first_infected_day,
+                                        recovered_day, death_day, final_state)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(patient_id) DO UPDATE SET
+                first_infected_day=excluded.first_infected_day,
+                recovered_day=excluded.recovered_day,
+                death_day=excluded.death_day,
+                final_state=excluded.final_state;
+            """, rows)
             self.conn.commit()
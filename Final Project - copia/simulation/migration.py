@@ -2,16 +2,13 @@
 from .events import EventBus
 
 class MigrationRouter:
-    def __init__(self, countries, event_bus: EventBus, logger=None):
+    def __init__(self, countries, event_bus: EventBus):
         #List of all countries in the simulation
         self.countries = countries
 
         #EventBus to notify other parts of the system when something happens
         self.bus = event_bus
 
-        #Logger to record travel data in the database
-        self.logger = logger
-
     def try_travel(self, patient, policy, day) -> bool:
         import random
 
@@ -34,25 +31,21 @@ class MigrationRouter:
         origin = patient.country
 
         #Remove the patient from the origin country
+        #The traveller counters and the trip per route are bumped inside the same
+        #critical sections, so each trip is counted exactly once at no extra lock
         with origin.lock:
             #Double-check the patient is still there (thread safety)
-            if patient not in origin.patients:
+            if not origin.remove_patient(patient):
                 return False
-            origin.patients.remove(patient)
             origin.travellers_out_today += 1
+            origin.trips_out[destination] += 1
 
         #Add the patient to the destination country
         with destination.lock:
-            destination.patients.append(patient)
+            destination.add_patient(patient)
             destination.travellers_in_today += 1
 
         #Update the patient's current country
         patient.country = destination
 
-        #Log the travel in the database if the logger is available.
-        if (self.logger is not None and
-            origin.db_id is not None and
-            destination.db_id is not None):
-            self.logger.log_travel(origin.db_id, destination.db_id)
-
         return True
\ No newline at end of file
@@ -2,11 +2,15 @@
 
 import random
 import threading
+from collections import Counter
 from .config import (
+    MASK_EFFECTIVENESS,
     TRANSMISSION_BASE,
     VACCINE_COST,
     VARIANT_DAY,
-    VARIANT_TRANSMISSION_MULTIPLIER
+    VARIANT_TRANSMISSION_MULTIPLIER,
+    VARIANT_VACCINE_EFFECTIVENESS_DROP,
+    vaccine_effectiveness,
 )
 
 """
@@ -20,18 +24,38 @@ applies infection dynamics and travel decisions to a group of patients.
 """
 
 class Patient:
-    def __init__(self, nationality, country):
+    #Fixed attribute layout: no per-instance __dict__, so each patient is
+    #smaller and attribute reads in the daily loop are slot lookups
+    __slots__ = (
+        "db_id", "country", "nationality", "sex", "age", "mask", "mask_factor",
+        "respiratory_disease", "is_superspreader", "high_risk", "base_death_prob",
+        "state", "days_infected", "infectious_period", "hospitalized", "pool_index",
+        "idx_in_country", "alive_index", "vaccinated", "vaccine_type", "has_treatment", "treatment_type",
+    )
+
+    #The random attributes are drawn by Country.create_patients for the whole
+    #population at once and passed in
+    def __init__(self, nationality, country, sex, age, mask, respiratory_disease, is_superspreader):
         #ID for the database, filled in by the logger
         self.db_id = None
 
         #Fixed Attributes
         self.country = country
         self.nationality = nationality
-        self.sex = random.choice(["M", "F"])
-        self.age = random.randint(1, 90)
-        self.mask = random.random() < country.mask_prob
-        self.respiratory_disease = random.random() < 0.12
-        self.is_superspreader = random.random() < 0.05
+        self.sex = sex
+        self.age = age
+        self.mask = mask
+        self.respiratory_disease = respiratory_disease
+        self.is_superspreader = is_superspreader
+
+        #Risk terms only depend on the fixed attributes, so they are computed once
+        #instead of on every day of the infection
+        self.high_risk = self.age >= 65 or self.respiratory_disease
+        self.base_death_prob = self.death_probability()
+
+        #Multiplier of the mask on the infection probability (1.0 without mask),
+        #so the contact loop multiplies instead of branching
+        self.mask_factor = 1 - MASK_EFFECTIVENESS if self.mask else 1.0
 
        #Disease State
         self.state = "healthy"
@@ -39,6 +63,14 @@ class Patient:
         self.infectious_period = None
         self.hospitalized = False
 
+        #Position inside country.healthy_pool while the patient is in it
+        self.pool_index = None
+
+        #Positions inside country.patients and country.alive_patients,
+        #set by the country that holds the patient
+        self.idx_in_country = None
+        self.alive_index = None
+
         #Vaccination and Treatment
         self.vaccinated = False
         self.vaccine_type = None
@@ -84,16 +116,45 @@ class Country:
         self.mask_prob = mask_prob
         self.lockdown_days = lockdown_days
 
+        #Every day covered by a lockdown window, so checking a day is O(1)
+        self.lockdown_day_set = frozenset(
+            d for (s, e) in lockdown_days for d in range(s, e + 1)
+        )
+        self.in_lockdown = False
+
+        #Random generator used by the disease dynamics of this country, seeded from
+        #the global one. The worker threads of a day share it and interleave their
+        #draws in scheduling order, so a random.seed() run only repeats exactly
+        #with max_workers=1
+        self.rng = random.Random(random.getrandbits(64))
+
         #Population
-        self.patients = [Patient(name, self) for _ in range(500)]
+        self.patients = self.create_patients(500)
+
+        #Patients that are not dead, kept up to date on deaths and travels
+        #so the daily batches are not filtered from the whole population
+        self.alive_patients = list(self.patients)
+        for i, p in enumerate(self.patients):
+            p.idx_in_country = i
+            p.alive_index = i
+
+        #Healthy patients that can be contacted today, rebuilt once per day
+        self.healthy_pool = []
+        self.infected_count = 0
         self.base_transmission = TRANSMISSION_BASE
 
+        #Factor applied to the infection probability of a person, per vaccine brand
+        #(None is the unvaccinated case, with no protection)
+        self.vaccine_factor = {v: 1 - eff for v, eff in vaccine_effectiveness.items()}
+        self.vaccine_factor[None] = 1.0
+
         """
-        Reentrant Lock: It prevents deadlocks when the same thread re-enters a locked section
-        In our simulation, it is important because there are methods that use a lock which call
-        another method that also use the same lock.
+        Plain Lock: no code path re-enters a locked section of the same country.
+        The helpers that run inside a critical section (allocate_treatment_if_budget,
+        remove_from_healthy_pool, add_patient, remove_patient, remove_from_alive)
+        expect the caller to hold the lock and never take it themselves.
         """
-        self.lock = threading.RLock()
+        self.lock = threading.Lock()
 
         #Economic model
         budget_map = {
@@ -126,6 +187,10 @@ class Country:
         self.travellers_in_today = 0
         self.travellers_out_today = 0
 
+        #Trips leaving this country per destination over the whole run,
+        #written under this country's lock and logged as migration routes at the end
+        self.trips_out = Counter()
+
         #Travel policy
         self.current_policy = None
 
@@ -133,19 +198,39 @@ class Country:
         self.vaccine_units_given = {code: 0 for code in VACCINE_COST.keys()}
         self._initial_vaccination()
 
+    #Draws the fixed attributes of n patients column by column, with the random
+    #functions bound once instead of looked up for every attribute of every patient
+    def create_patients(self, n):
+        rand = random.random
+        mask_prob = self.mask_prob
+
+        sexes = random.choices(("M", "F"), k=n)
+        ages = random.choices(range(1, 91), k=n)
+        masks = [rand() < mask_prob for _ in range(n)]
+        respiratory = [rand() < 0.12 for _ in range(n)]
+        superspreaders = [rand() < 0.05 for _ in range(n)]
+
+        name = self.name
+        return [
+            Patient(name, self, sex, age, mask, resp, sup)
+            for sex, age, mask, resp, sup in zip(sexes, ages, masks, respiratory, superspreaders)
+        ]
+
     #Apply an initial vaccination campaign before the simulation starts
     def _initial_vaccination(self):
         if not self.vaccines or self.vaccines is None:
             return
 
+        rand = random.random
+        choice = random.choice
         for p in self.patients:
-            if random.random() < 0.5 and self.budget_remaining > 0:
+            if rand() < 0.5 and self.budget_remaining > 0:
                 affordable = [
                     v for v in self.vaccines
                     if self.budget_remaining >= VACCINE_COST[v]]
                 if not affordable:
                     break
-                vtype = random.choice(affordable)
+                vtype = choice(affordable)
                 with self.lock:
                     if self.budget_remaining < VACCINE_COST[vtype]:
                         continue
@@ -157,11 +242,102 @@ class Country:
                     #Counts units per brand
                     self.vaccine_units_given[vtype] += 1
 
-    #Updates the base_transmission to the new variant
+    #Collects the healthy patients once per day, so infected patients
+    #sample their contacts from it instead of scanning the population.
+    #The same pass counts the infected, used for the daily infection rate
+    def build_healthy_pool(self):
+        with self.lock:
+            pool = []
+            infected = 0
+            for p in self.patients:
+                state = p.state
+                if state == "healthy":
+                    p.pool_index = len(pool)
+                    pool.append(p)
+                elif state == "infected":
+                    infected += 1
+            self.healthy_pool = pool
+            self.infected_count = infected
+
+    #Removes a newly infected patient or a traveller from the pool in O(1),
+    #moving the last patient into its slot. Must be called holding the lock.
+    #Returns False if the patient was not in this country's pool
+    def remove_from_healthy_pool(self, patient):
+        pool = self.healthy_pool
+        i = patient.pool_index
+        if i is None or i >= len(pool) or pool[i] is not patient:
+            return False
+        last = pool.pop()
+        if last is not patient:
+            pool[i] = last
+            last.pool_index = i
+        patient.pool_index = None
+        return True
+
+    #The order of self.patients has no meaning, so a traveller is removed in O(1)
+    #by moving the last patient into its slot. Both must be called holding the lock.
+    #A healthy traveller also moves between the healthy pools, so it can only be
+    #contacted (and its treatment paid) by the country it is in
+    def add_patient(self, patient):
+        patient.idx_in_country = len(self.patients)
+        self.patients.append(patient)
+        if patient.state != "dead":
+            patient.alive_index = len(self.alive_patients)
+            self.alive_patients.append(patient)
+        if patient.state == "healthy":
+            patient.pool_index = len(self.healthy_pool)
+            self.healthy_pool.append(patient)
+
+    def remove_patient(self, patient):
+        patients = self.patients
+        i = patient.idx_in_country
+        if i is None or i >= len(patients) or patients[i] is not patient:
+            return False
+        last = patients.pop()
+        if last is not patient:
+            patients[i] = last
+            last.idx_in_country = i
+        patient.idx_in_country = None
+        self.remove_from_alive(patient)
+        self.remove_from_healthy_pool(patient)
+        return True
+
+    #Takes a patient out of alive_patients when it dies or leaves the country
+    def remove_from_alive(self, patient):
+        alive = self.alive_patients
+        i = patient.alive_index
+        if i is None or i >= len(alive) or alive[i] is not patient:
+            return
+        last = alive.pop()
+        if last is not patient:
+            alive[i] = last
+            last.alive_index = i
+        patient.alive_index = None
+
+    #Recomputes alive_patients from scratch, when the states are reset
+    def rebuild_alive_patients(self):
+        with self.lock:
+            self.alive_patients = [p for p in self.patients if p.state != "dead"]
+            for i, p in enumerate(self.alive_patients):
+                p.alive_index = i
+
+    #Lockdown status for the day, read by every infected patient
+    def update_lockdown(self, day:int):
+        self.in_lockdown = day in self.lockdown_day_set
+
+    #Updates the base_transmission and the vaccine protection to the new variant
     def update_transmission(self, day:int):
         base = TRANSMISSION_BASE
+        drop = 0.0
         if day >= VARIANT_DAY:
             base *= VARIANT_TRANSMISSION_MULTIPLIER
+            drop = VARIANT_VACCINE_EFFECTIVENESS_DROP
         self.base_transmission = base
 
+        #Computed once per day instead of for every contact with a vaccinated person
+        self.vaccine_factor = {
+            v: 1 - max(0.0, eff - drop) for v, eff in vaccine_effectiveness.items()
+        }
+        self.vaccine_factor[None] = 1.0
+
 
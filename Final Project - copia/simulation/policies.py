@@ -39,6 +39,12 @@ class FreeTravel(TravelPolicy):
         choices = [c for c in countries if c is not patient.country]
         return random.choice(choices) if choices else None
 
+#The policies hold no state, so one shared instance of each is returned
+#instead of building a new object per country and per day
+NO_TRAVEL = NoTravel()
+TEN_PERCENT = TenPercent()
+FREE_TRAVEL = FreeTravel()
+
 #Time based policy schedule
 """
 This is the fixed time-based policy schedule for the non-adaptive countries.
@@ -52,15 +58,15 @@ This baseline can be overridden by adaptive_policy_for for some countries.
 
 def day_policy_for(country_name: str, day: int) -> TravelPolicy:
     if day == 1:
-        return NoTravel()
+        return NO_TRAVEL
 
     if 2 <= day <= 9:
-        return FreeTravel() if country_name in ("Italy", "Sweden") else TenPercent()
+        return FREE_TRAVEL if country_name in ("Italy", "Sweden") else TEN_PERCENT
 
     if 10 <= day <= 20:
-        return NoTravel() if country_name == "Germany" else TenPercent()
+        return NO_TRAVEL if country_name == "Germany" else TEN_PERCENT
 
-    return FreeTravel() if country_name == "Sweden" else TenPercent()
+    return FREE_TRAVEL if country_name == "Sweden" else TEN_PERCENT
 
 #Adaptive travel policy based on current infection rate
 def adaptive_policy_for(country, day, infection_rate: float) -> TravelPolicy:
@@ -74,23 +80,23 @@ def adaptive_policy_for(country, day, infection_rate: float) -> TravelPolicy:
 
         #Very high infection - Strong closure
         if infection_rate > 0.20:
-            return NoTravel()
+            return NO_TRAVEL
 
         #Moderate infection - Restricted Travel
         elif infection_rate > 0.05:
-            return TenPercent()
+            return TEN_PERCENT
 
         #Low infection - Normal Travel
         else:
-            return FreeTravel()
+            return FREE_TRAVEL
 
     # UK: less conservative
     if country.name == "UK":
         if infection_rate > 0.30:
-            return NoTravel()
+            return NO_TRAVEL
         elif infection_rate > 0.10:
-            return TenPercent()
+            return TEN_PERCENT
         else:
-            return FreeTravel()
+            return FREE_TRAVEL
 
     return day_policy_for(country.name, day)
@@ -6,40 +6,37 @@ This module coordinates the following processes:
 - adaptive policies reacting to infection rates,
 - vaccination campaigns and limited health system resources,
 - the parallel execution of patients using a ThreadPoolExecutor
+
+The batches of every country go to the same pool, so within a day all
+countries are processed concurrently; the day only ends once every batch
+of every country has finished.
 """
 import random
+from collections import Counter
+from operator import attrgetter
 from concurrent.futures import ThreadPoolExecutor, wait
 
 from .policies import day_policy_for, adaptive_policy_for
 from .events import EventBus, PolicyReporterObserver
 from .migration import MigrationRouter
-from .workers import process_patient_batch
+from .workers import process_batch_shard
 from .models import Country
 from .logger import SQLiteLogger
+from .disease import allocate_treatment_if_budget
 from .config import (
+    INFECTIOUS_PERIOD_RANGE,
+    INITIAL_INFECTED_FRAC,
     VACCINE_COST,
     VACCINATION_CAMPAIGN_DAY,
+    VARIANT_DAY,
     TREATMENT_COST,
     vaccine_effectiveness,
     treatment_effectiveness,
 )
 
-#This is a simple iterator for simulation days.
-#Helps keep the daily loop explicit.
-class SimulationDays:
-    def __init__(self, start=1, end=30):
-        self.current = start
-        self.end = end
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.current > self.end:
-            raise StopIteration
-        d = self.current
-        self.current += 1
-        return d
+#Vaccination priority: high risk patients first (a respiratory disease or 65+),
+#then older patients. high_risk is precomputed on every Patient
+_RISK_KEY = attrgetter("high_risk", "age")
 
 #Coordinates countries, patients, workers and logging.
 class Simulation:
@@ -49,6 +46,7 @@ class Simulation:
         self.total_travel = 0
 
         #Parallel execution settings
+        self.max_workers = max_workers
         self.batch_size = batch_size
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
 
@@ -60,20 +58,15 @@ class Simulation:
         self.bus.subscribe(self.policy_reporter)
 
         #Migration Router to handle travel between countries
-        self.router = MigrationRouter(countries, self.bus, logger=self.logger)
-
-        #Current policy per country
-        self._policy_obj_by_country = {c.name: None for c in countries}
+        self.router = MigrationRouter(countries, self.bus)
 
     #This seeds the virus only in Italy
     def seed_virus(self):
-        from .config import INITIAL_INFECTED_FRAC, INFECTIOUS_PERIOD_RANGE
-        from .disease import allocate_treatment_if_budget
-
         #Resets all patients to a clean initial state when we run the simulation
         for c in self.countries:
             for p in c.patients:
                 p.reset()
+            c.rebuild_alive_patients()
 
         #Infects a fraction of the patients in Italy
         italy = next((c for c in self.countries if c.name == "Italy"), None)
@@ -85,10 +78,11 @@ class Simulation:
             print("Warning: initial_k <= 0, no initial infection in Italy.")
             return
 
-        for p in random.sample(italy.patients, k=initial_k):
-            p.state = "infected"
-            p.infectious_period = random.randint(*INFECTIOUS_PERIOD_RANGE)
-            allocate_treatment_if_budget(italy, p)
+        with italy.lock:
+            for p in random.sample(italy.patients, k=initial_k):
+                p.state = "infected"
+                p.infectious_period = random.randint(*INFECTIOUS_PERIOD_RANGE)
+                allocate_treatment_if_budget(italy, p)
 
         infected = sum(1 for p in italy.patients if p.state == "infected")
         print(f"\nVIRUS SEEDED IN ITALY ONLY. Number of initial infected: {infected}\n")
@@ -110,6 +104,22 @@ class Simulation:
         if unit_cost <= 0:
             return
 
+        #Only the copy of the alive list needs the lock: the scan and the sort
+        #run outside it, and every candidate is checked again before vaccinating
+        with country.lock:
+            alive = list(country.alive_patients)
+
+        #We select the candidates. Those alive and not yet vaccinated
+        candidates = [p for p in alive if not p.vaccinated]
+
+        if not candidates:
+            return
+
+        #Priorities:
+        #1) Patients with a respiratory disease
+        #2) Older patients
+        candidates.sort(key=_RISK_KEY, reverse=True)
+
         with country.lock:
             #Maximum vaccines countries can pay
             max_by_budget = int(country.budget_remaining // unit_cost)
@@ -123,46 +133,33 @@ class Simulation:
 
             max_to_vaccinate = min(max_by_budget, remaining_capacity)
 
-            #We select the candidates. Those alive and not yet vaccinated
-            candidates = [
-                p for p in country.patients
-                if (p.state != "dead" and not p.vaccinated)
-            ]
-
-            if not candidates:
-                return
-
-            #Priorities:
-            #1) Patients with a respiratory disease
-            #2) Older patients
-
-            def risk_key(p):
-                high_risk = 1 if p.respiratory_disease or p.age >= 65 else 0
-                return (high_risk, p.age)
-
-            candidates.sort(key=risk_key, reverse=True)
-            to_vaccinate = candidates[:max_to_vaccinate]
-
-            for p in to_vaccinate:
-                #In case, the budget runs out in the middle of the day
-                if country.budget_remaining < unit_cost:
+            #max_to_vaccinate already fits in the budget, which cannot change while
+            #the lock is held, so the counters are updated once after the loop
+            given = 0
+            for p in candidates:
+                if given >= max_to_vaccinate:
                     break
-                if p.vaccinated:
+
+                #The patient may have been vaccinated, died or left the country
+                #since the candidates were selected
+                if p.vaccinated or p.state == "dead" or p.country is not country:
                     continue
 
+                given += 1
                 p.vaccinated = True
                 p.vaccine_type = main_vaccine
-                country.budget_remaining -= unit_cost
-                country.budget_spent_vaccines += unit_cost
-                country.vaccinated_today += 1
-                country.vaccine_units_given[main_vaccine] += 1
+
+            country.budget_remaining -= given * unit_cost
+            country.budget_spent_vaccines += given * unit_cost
+            country.vaccinated_today += given
+            country.vaccine_units_given[main_vaccine] += given
 
     #Main simulation loop
     def run(self, max_days=30):
         self.seed_virus()
 
-        for day in SimulationDays(1, max_days):
-            from .config import VARIANT_DAY
+        #Days are numbered from 1 to max_days, both included
+        for day in range(1, max_days + 1):
             print(f"\n================= DAY {day} =================")
             if day == VARIANT_DAY:
                 print("🧬 ⚠️ NEW VARIANT DETECTED: more contagious and vaccines less effective.")
@@ -174,16 +171,20 @@ class Simulation:
                 country.travellers_out_today = 0
                 country.vaccinated_today = 0
                 country.update_transmission(day)
+                country.update_lockdown(day)
 
                 #Runs the daily vaccination campaign
                 self.run_vaccination_campaign(country, day)
 
             #Step 2: Compute infection rates per country
+            #States do not change again until the workers run in step 4, so the
+            #healthy pool is built here and its pass also counts the infected.
+            #No worker is running yet, so the counts are read without the lock
             infection_rates = {}
             for country in self.countries:
-                with country.lock:
-                    total = len(country.patients)
-                    infected = sum(1 for p in country.patients if p.state == "infected")
+                country.build_healthy_pool()
+                total = len(country.patients)
+                infected = country.infected_count
                 infection_rates[country.name] = infected / total if total > 0 else 0.0
 
             #Step 3: Choose the travel policy for each country
@@ -196,7 +197,6 @@ class Simulation:
                     policy = day_policy_for(country.name, day)
 
                 country.current_policy = policy
-                self._policy_obj_by_country[country.name] = policy
 
                 #Notify the observers and print policy changes
                 self.bus.publish(
@@ -208,30 +208,41 @@ class Simulation:
 
             #Step 4: Submit batch tasks to the threadpool
             futures = []
+            #The alive lists are copied before any batch is submitted, since the
+            #workers update them on deaths and travels while the batches are sliced
+            alive_by_country = []
             for country in self.countries:
                 with country.lock:
-                    alive = [p for p in country.patients if p.state != "dead"]
-
-                for i in range(0, len(alive), self.batch_size):
-                    batch = alive[i:i + self.batch_size]
-                    futures.append(
-                        self.executor.submit(process_patient_batch,
-                                             batch,
-                                             self,
-                                             country,
-                                             day)
-                                            )
+                    alive_by_country.append((country, list(country.alive_patients)))
+
+            batches = [
+                (country, alive[i:i + self.batch_size])
+                for country, alive in alive_by_country
+                for i in range(0, len(alive), self.batch_size)
+            ]
+
+            #The batches are dealt round-robin into one shard per worker, so the
+            #pool gets max_workers tasks per day instead of one Future per batch
+            n_shards = min(self.max_workers, len(batches))
+            for k in range(n_shards):
+                futures.append(
+                    self.executor.submit(process_batch_shard,
+                                         batches[k::n_shards],
+                                         self,
+                                         day)
+                                        )
             #Waits for all workers to finish for this day
             wait(futures)
 
             #Step 5: Log patient states
+            #The whole day is written in a single transaction, committed after step 8
+            #No lock is needed: every worker has finished after wait(futures)
             if self.logger is not None:
-                for c in self.countries:
-                    with c.lock:
-                        for p in c.patients:
-                            self.logger.log_patient_state(p, day)
+                self.logger.begin_bulk()
+                self.logger.log_patient_states(self.all_patients, day)
 
             #Step 6: Print Travel Summary
+            #The counters are read after wait(futures), once every worker is done
             print("\n✈️  Daily Travels:")
             for country in self.countries:
                 print(
@@ -245,12 +256,14 @@ class Simulation:
 
             #Step 8: Print Epidemiological Summary
             print("\n📊 Epidemiological State per Country:")
+            #A single pass over all patients tallies every (nationality, state) pair
+            counts = Counter((p.nationality, p.state) for p in self.all_patients)
             for country in self.countries:
                 nat = country.name
-                h = sum(1 for p in self.all_patients if p.nationality == nat and p.state == "healthy")
-                f = sum(1 for p in self.all_patients if p.nationality == nat and p.state == "infected")
-                r = sum(1 for p in self.all_patients if p.nationality == nat and p.state == "recovered")
-                d = sum(1 for p in self.all_patients if p.nationality == nat and p.state == "dead")
+                h = counts[(nat, "healthy")]
+                f = counts[(nat, "infected")]
+                r = counts[(nat, "recovered")]
+                d = counts[(nat, "dead")]
                 print(
                     f"   - {nat:8} | 😷 Healthy: {h:4} | 🤒 Infected: {f:4} | ✅ Rec: {r:4} | ☠️ Dead: {d:4}"
                 )
@@ -259,36 +272,46 @@ class Simulation:
                 if self.logger is not None and country.db_id is not None:
                     self.logger.log_metrics(country.db_id, day, h, f, r, d)
 
+            if self.logger is not None:
+                self.logger.flush_metrics()
+                self.logger.commit_bulk()
+
         #After all days, finalises logger and prints the global summary
-        if self.logger is not None:
-            self.logger.finalize_patient_results(self.all_patients)
-            populations_by_id = {c.db_id: len(c.patients) for c in self.countries}
-            self.logger.finalize_migration_routes(populations_by_id)
+        #The pool and the database are released even if a post-processing step
+        #fails, so the exclusive lock of the logger is never left behind
+        try:
+            if self.logger is not None:
+                self.logger.finalize_state_table()
+                self.logger.finalize_patient_results(self.all_patients)
+
+                #Trips were counted per route by the travel router, under the origin lock
+                for origin in self.countries:
+                    for destination, count in origin.trips_out.items():
+                        if origin.db_id is not None and destination.db_id is not None:
+                            self.logger.log_travel(origin.db_id, destination.db_id, count)
+                populations_by_id = {c.db_id: len(c.patients) for c in self.countries}
+                self.logger.finalize_migration_routes(populations_by_id)
+                self.logger.materialize_time_series()
+
+            self.final_summary()
+        finally:
+            self.executor.shutdown(wait=True)
 
-        self.final_summary()
-        self.executor.shutdown(wait=True)
+            if self.logger is not None:
+                self.logger.close()
 
     #Final Summary
     def final_summary(self):
-        total_h = total_i = total_r = total_d = 0
-        for p in self.all_patients:
-            if p.state == "healthy":
-                total_h += 1
-            elif p.state == "infected":
-                total_i += 1
-            elif p.state == "recovered":
-                total_r += 1
-            elif p.state == "dead":
-                total_d += 1
+        totals = Counter(p.state for p in self.all_patients)
         print("\n=========== FINAL RESULT ===========")
-        print(f"Total Healthy:   {total_h}")
-        print(f"Total Infected:  {total_i}")
-        print(f"Total Recovered: {total_r}")
-        print(f"Total Dead:      {total_d}")
+        print(f"Total Healthy:   {totals['healthy']}")
+        print(f"Total Infected:  {totals['infected']}")
+        print(f"Total Recovered: {totals['recovered']}")
+        print(f"Total Dead:      {totals['dead']}")
         print("=======================================")
 
 #Creates the base configuration of the countries
-def build_default_world(db_path="data/simulation.sqlite"):
+def build_default_world(db_path="data/simulation.sqlite", exclusive=True):
     countries = [
         Country("Germany", ["A", "B"], ["T1", "T2"], 0.9, [(8, 17),(23,28)]),
         Country("Italy",   ["C"],       ["T1"],       0.8, [(5, 15)]),
@@ -300,7 +323,9 @@ def build_default_world(db_path="data/simulation.sqlite"):
     ]
 
     #Initialises SQLiteLogger
-    logger = SQLiteLogger(db_path=db_path)
+    #The whole world setup is written in a single transaction
+    logger = SQLiteLogger(db_path=db_path, exclusive=exclusive)
+    logger.begin_bulk()
 
     #Catalogue pf Vaccines and Treatments
     for brand, eff in vaccine_effectiveness.items():
@@ -333,6 +358,8 @@ def build_default_world(db_path="data/simulation.sqlite"):
             pid = logger.insert_patient(cid, p)
             p.db_id = pid
 
+    logger.commit_bulk()
+
     sim = Simulation(countries, max_workers=32, batch_size=10, logger=logger)
     sim.logger = logger
     return sim
\ No newline at end of file
@@ -5,8 +5,9 @@ These are the worker utilities for parallel processing of patients.
 This module is used by the Simulation engine together with a ThreadPoolExecutor.
 
 Parallelism model:
- - The simulation submits many of these batch tasks (10 patients per task).
- - Each worker thread calls this function with its own list of patients.
+ - The simulation splits every country's patients into batches (10 patients each)
+    and deals the batches into one shard per worker thread.
+ - Each worker thread runs a shard, calling process_patient_batch on its batches.
  - The shared states (patients list, budgets, hospital capacity, traveller counts)
     are protected by locks inside Country and MigrationRouter.
 """
@@ -17,10 +18,14 @@ from .disease import infection_step
 #the infection dynamics to each patient and the travel decisions.
 def process_patient_batch(patients, simulation, country, day):
 
-    #Current travel policy for this country
-    policy = simulation._policy_obj_by_country.get(country.name)
+    #Current travel policy for this country, chosen in step 3 of the day
+    policy = country.current_policy
     router = simulation.router
 
+    #The policies give the same travel probability to every patient of a day,
+    #so with closed borders the batch skips the travel step altogether
+    can_travel = policy is not None and policy.travel_probability(None, day) > 0
+
     #Infection dynamics
     for p in patients:
         try:
@@ -28,24 +33,20 @@ def process_patient_batch(patients, simulation, country, day):
             infection_step(p, country, day)
 
             #Step 2: Travel decision
-            if policy is not None and p.state != "dead":
-                origin = p.country
-                travelled = router.try_travel(p, policy, day)
-
-                if travelled:
-                    destination = p.country
-
-                    #Counts one departure from the origin
-                    with origin.lock:
-                        origin.travellers_out_today += 1
-
-                    #Counts one arrival in the destination
-                    with destination.lock:
-                        destination.travellers_in_today += 1
+            #try_travel already counts the departure and the arrival inside the
+            #critical sections where it moves the patient
+            if can_travel and p.state != "dead":
+                router.try_travel(p, policy, day)
 
         #To avoid one bad patient crashing a whole worker
         except Exception as exc:
             print(
                 f"[WARN] Exception processing patient {getattr(p, 'db_id', None)} "
                 f"on day {day} in {country.name}: {exc}"
-            )
\ No newline at end of file
+            )
+
+#Processes a shard of (country, batch) pairs, the single task a worker
+#thread receives for the day
+def process_batch_shard(batches, simulation, day):
+    for country, patients in batches:
+        process_patient_batch(patients, simulation, country, day)
@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from simulation.events import EventBus
+from simulation.migration import MigrationRouter
+from simulation.models import Country
+from simulation.policies import TravelPolicy
+
+
+#Sends every patient to a fixed destination
+class AlwaysTo(TravelPolicy):
+    def __init__(self, destination):
+        self.destination = destination
+
+    def travel_probability(self, patient, day):
+        return 1.0
+
+    def pick_destination(self, patient, countries):
+        return self.destination
+
+
+def pools_containing(patient, countries):
+    return [c for c in countries if any(q is patient for q in c.healthy_pool)]
+
+
+class TravelHealthyPoolTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.origin = Country("Italy", ["C"], ["T1"], 0.8, [])
+        self.destination = Country("Spain", ["B"], ["T2"], 0.7, [])
+        self.countries = [self.origin, self.destination]
+        for c in self.countries:
+            c.build_healthy_pool()
+        self.router = MigrationRouter(self.countries, EventBus())
+
+    def test_healthy_traveller_is_in_exactly_one_pool(self):
+        patient = self.origin.healthy_pool[0]
+
+        self.assertTrue(self.router.try_travel(patient, AlwaysTo(self.destination), day=2))
+
+        self.assertEqual(pools_containing(patient, self.countries), [self.destination])
+        self.assertIs(self.destination.healthy_pool[patient.pool_index], patient)
+        self.assertIs(patient.country, self.destination)
+
+    def test_origin_cannot_infect_a_departed_traveller(self):
+        patient = self.origin.healthy_pool[0]
+        self.router.try_travel(patient, AlwaysTo(self.destination), day=2)
+
+        with self.origin.lock:
+            self.assertFalse(self.origin.remove_from_healthy_pool(patient))
+
+    def test_infected_traveller_joins_no_pool(self):
+        patient = self.origin.healthy_pool[0]
+        with self.origin.lock:
+            self.origin.remove_from_healthy_pool(patient)
+            patient.state = "infected"
+
+        self.assertTrue(self.router.try_travel(patient, AlwaysTo(self.destination), day=2))
+
+        self.assertEqual(pools_containing(patient, self.countries), [])
+        self.assertIsNone(patient.pool_index)
+
+
+if __name__ == "__main__":
+    unittest.main()